@@ -1,24 +1,47 @@
 import sqlite3
+import atexit
 import csv
+import functools
+import hashlib
+import hmac
+import html
+import io
 import os
 import secrets
 import logging
+import logging.handlers
+import queue
+import threading
+import time
 from datetime import datetime, timedelta
-from flask import Flask, render_template, request, redirect, url_for, flash, make_response, session, abort
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, get_flashed_messages, session, abort, stream_template, stream_with_context
 from flask_wtf import FlaskForm, CSRFProtect
-from flask_wtf.csrf import CSRFError
+from flask_wtf.csrf import CSRFError, generate_csrf
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
+from flask_session import Session
 from wtforms import StringField, TextAreaField, PasswordField, validators
 from wtforms.validators import DataRequired, Length
-import bleach
 import re
+import redis
+from werkzeug.routing import BaseConverter
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+class PosIntConverter(BaseConverter):
+    """URL converter that only matches positive integers (no leading zeros)"""
+    regex = r'[1-9]\d*'
+
+    def to_python(self, value):
+        return int(value)
+
+    def to_url(self, value):
+        return str(value)
+
 app = Flask(__name__)
+app.url_map.converters['posint'] = PosIntConverter
 
 # Security Configuration
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', secrets.token_hex(32))
@@ -28,20 +51,83 @@ app.config['SESSION_COOKIE_HTTPONLY'] = True
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=2)
 
+# Redis connection pool shared by the session store and the rate limiter
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+redis_pool = redis.ConnectionPool.from_url(REDIS_URL)
+
+# Server-side sessions: the cookie only carries a signed session id
+app.config['SESSION_TYPE'] = 'redis'
+app.config['SESSION_REDIS'] = redis.Redis(connection_pool=redis_pool)
+app.config['SESSION_USE_SIGNER'] = True
+app.config['SESSION_KEY_PREFIX'] = 'cruciverba:session:'
+
 # Initialize security extensions
+Session(app)
 csrf = CSRFProtect(app)
+# Counters live in Redis so every worker and replica shares the same limits;
+# if Redis is unreachable the limiter falls back to per-process memory
+rate_limit_storage_url = os.getenv('RATE_LIMIT_STORAGE_URL', REDIS_URL)
 limiter = Limiter(
     key_func=get_remote_address,
     app=app,
     default_limits=["200 per day", "50 per hour"],
-    storage_uri=os.getenv('RATE_LIMIT_STORAGE_URL', 'memory://')
+    storage_uri=rate_limit_storage_url,
+    storage_options={'connection_pool': redis_pool} if rate_limit_storage_url == REDIS_URL else {},
+    strategy='moving-window',
+    in_memory_fallback_enabled=True
 )
 
 # Configure logging
+class BufferedFileHandler(logging.FileHandler):
+    """File handler that batches writes instead of flushing every record.
+
+    The buffer is flushed once ``flush_size`` characters are pending, every
+    ``flush_interval`` seconds, and immediately for WARNING and above so that
+    security events reach the disk even if the process crashes.
+    """
+
+    def __init__(self, filename, buffer_size=65536, flush_size=32768, flush_interval=1.0):
+        self.buffer_size = buffer_size
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._pending = 0
+        self._stop_flushing = threading.Event()
+        super().__init__(filename, encoding='utf-8')
+        threading.Thread(target=self._flush_periodically, daemon=True).start()
+
+    def _open(self):
+        return open(self.baseFilename, self.mode, buffering=self.buffer_size, encoding=self.encoding)
+
+    def emit(self, record):
+        try:
+            if self.stream is None:
+                self.stream = self._open()
+            msg = self.format(record) + self.terminator
+            self.stream.write(msg)
+            self._pending += len(msg)
+            if record.levelno >= logging.WARNING or self._pending >= self.flush_size:
+                self.flush()
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        with self.lock:
+            super().flush()
+            self._pending = 0
+
+    def close(self):
+        self._stop_flushing.set()
+        super().close()
+
+    def _flush_periodically(self):
+        while not self._stop_flushing.wait(self.flush_interval):
+            if self._pending:
+                self.flush()
+
 log_handlers = [logging.StreamHandler()]
 # Only add file handler if we can write to filesystem
 try:
-    log_handlers.append(logging.FileHandler('/tmp/app.log'))
+    log_handlers.append(BufferedFileHandler('/tmp/app.log'))
 except (OSError, PermissionError):
     pass  # Use only StreamHandler if we can't write files
 
@@ -50,6 +136,12 @@ logging.basicConfig(
     format='%(asctime)s %(levelname)s %(name)s %(message)s',
     handlers=log_handlers
 )
+# Requests only enqueue records; a background listener does the actual I/O
+log_queue = queue.Queue(-1)
+log_listener = logging.handlers.QueueListener(log_queue, *log_handlers, respect_handler_level=True)
+log_listener.start()
+atexit.register(log_listener.stop)
+logging.getLogger().handlers = [logging.handlers.QueueHandler(log_queue)]
 logger = logging.getLogger(__name__)
 
 # WTF Forms for CSRF protection
@@ -74,19 +166,40 @@ class ContributionForm(FlaskForm):
     ])
 
 # Security functions
+# Anything that opens like an HTML tag, comment or declaration
+_TAG_RE = re.compile(r'<[a-zA-Z/!?][^>]*>')
+
 def sanitize_input(text):
-    """Sanitize user input to prevent XSS"""
+    """Sanitize user input to prevent XSS (strip all markup, escape the rest)"""
     if not text:
         return text
-    return bleach.clean(text.strip(), tags=[], attributes={}, strip=True)
+    # Entities already in the input are decoded first so they are not escaped twice
+    return html.escape(html.unescape(_TAG_RE.sub('', text).strip()), quote=False)
+
+# Passwords are read from the environment once, at import
+_FORM_PASSWORD = os.getenv('FORM_PASSWORD', 'bianca')
+_ADMIN_PASSWORD = os.getenv('ADMIN_PASSWORD', 'bianca2024')
 
 def get_form_password():
     """Get form password from environment"""
-    return os.getenv('FORM_PASSWORD', 'bianca')
+    return _FORM_PASSWORD
 
 def get_admin_password():
     """Get admin password from environment"""
-    return os.getenv('ADMIN_PASSWORD', 'bianca2024')
+    return _ADMIN_PASSWORD
+
+def password_matches(password, expected):
+    """Compare passwords in constant time to avoid timing side channels"""
+    return hmac.compare_digest(password.encode('utf-8'), expected.encode('utf-8'))
+
+def admin_required(view):
+    """Reject requests without an admin session with 403"""
+    @functools.wraps(view)
+    def wrapped(*args, **kwargs):
+        if not session.get('admin_logged_in'):
+            abort(403)
+        return view(*args, **kwargs)
+    return wrapped
 
 def log_security_event(event_type, details):
     """Log security events"""
@@ -95,54 +208,123 @@ def log_security_event(event_type, details):
 
 # Database setup
 def init_db():
+    db_path = os.getenv('DATABASE_PATH', 'data/cruciverba.db')
     # Ensure data directory exists
-    os.makedirs('data', exist_ok=True)
-    conn = sqlite3.connect('data/cruciverba.db')
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS submissions
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  parola TEXT NOT NULL,
-                  frase_indizio TEXT NOT NULL,
-                  nome TEXT,
-                  timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)''')
-    conn.commit()
+    os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+    # Autocommit mode, so transaction boundaries below are explicit
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    # WAL mode is persistent on the database file, so it is set only once here
+    conn.execute('PRAGMA journal_mode = WAL')
+    # Create the schema in a single transaction
+    with conn:
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute('''CREATE TABLE IF NOT EXISTS submissions
+                        (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                         parola TEXT NOT NULL,
+                         frase_indizio TEXT NOT NULL,
+                         nome TEXT,
+                         timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)''')
+        # Databases from before the unique index may hold duplicates left by the
+        # old check-then-insert race; keep the oldest copy so the index can be built
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_sub_lc'").fetchone():
+            removed = conn.execute('''DELETE FROM submissions WHERE id NOT IN
+                                      (SELECT MIN(id) FROM submissions
+                                       GROUP BY parola COLLATE NOCASE, frase_indizio)''').rowcount
+            if removed:
+                logger.warning(f"Removed {removed} duplicate submissions before creating idx_sub_lc")
+        # Covering index for the case-insensitive duplicate check on submission
+        conn.execute('''CREATE UNIQUE INDEX IF NOT EXISTS idx_sub_lc
+                        ON submissions (parola COLLATE NOCASE, frase_indizio)''')
+        # Lets the admin views read submissions newest first without sorting
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_sub_ts ON submissions (timestamp DESC)')
     conn.close()
 
+# One connection per worker thread, opened lazily and reused across requests
+_pool = threading.local()
+
 def get_db_connection():
-    db_path = os.getenv('DATABASE_PATH', 'data/cruciverba.db')
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    # Enable foreign keys and other security features
-    conn.execute('PRAGMA foreign_keys = ON')
-    conn.execute('PRAGMA journal_mode = WAL')
+    """Get this thread's pooled database connection"""
+    conn = getattr(_pool, 'conn', None)
+    if conn is None:
+        db_path = os.getenv('DATABASE_PATH', 'data/cruciverba.db')
+        # Prepared statements are reused from the per-connection cache, keyed on SQL text
+        conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None,
+                               cached_statements=256)
+        conn.row_factory = sqlite3.Row
+        # Per-connection settings, applied once when the connection is opened
+        conn.executescript(
+            'PRAGMA synchronous = NORMAL; '
+            'PRAGMA foreign_keys = ON; '
+            'PRAGMA cache_size = -20000; '
+            'PRAGMA temp_store = MEMORY; '
+            'PRAGMA mmap_size = 268435456; '
+            'PRAGMA journal_size_limit = 6144000; '
+            'PRAGMA busy_timeout = 5000;'
+        )
+        _pool.conn = conn
     return conn
 
+@app.teardown_appcontext
+def release_db_connection(exception):
+    """Return the pooled connection in a clean state (it is not closed)"""
+    conn = getattr(_pool, 'conn', None)
+    if conn is not None and conn.in_transaction:
+        conn.rollback()
+
+# Admin dashboard pagination
+ADMIN_PAGE_SIZE = 50
+ADMIN_MAX_PAGE_SIZE = 200
+
+@functools.lru_cache(maxsize=1)
+def count_named_submissions(last_id, total):
+    """Count submissions with a name, cached while the table is unchanged"""
+    conn = get_db_connection()
+    # Empty names (e.g. markup-only input sanitized to '') count as anonymous
+    return conn.execute("SELECT COUNT(NULLIF(nome, '')) FROM submissions").fetchone()[0]
+
+def admin_etag(last_id, total, page, size):
+    """ETag for an admin dashboard page.
+
+    Besides the table state and the page shown, it covers the session's CSRF
+    token and the current half hour, so a cached page never carries delete
+    forms whose CSRF tokens have expired.
+    """
+    window = int(time.time() // (app.config['WTF_CSRF_TIME_LIMIT'] // 2))
+    key = f"{last_id}:{total}:{page}:{size}:{session.get('csrf_token')}:{window}"
+    return hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+
 # Validation functions
+_WORD_RE = re.compile(r'^[a-zA-ZàáèéìíòóùúÀÁÈÉÌÍÒÓÙÚ\s]+$')
+
 def is_valid_word(word):
     """Check if input is a valid word (can contain spaces)"""
-    return bool(re.match(r'^[a-zA-ZàáèéìíòóùúÀÁÈÉÌÍÒÓÙÚ\s]+$', word.strip()))
+    return bool(_WORD_RE.match(word.strip()))
 
 def is_valid_clue(clue):
     """Check if clue is at least 10 characters"""
     return len(clue.strip()) >= 10
 
 # Security headers
-@app.after_request
-def set_security_headers(response):
-    """Set security headers"""
-    response.headers['X-Content-Type-Options'] = 'nosniff'
-    response.headers['X-Frame-Options'] = 'DENY'
-    response.headers['X-XSS-Protection'] = '1; mode=block'
-    response.headers['Strict-Transport-Security'] = 'max-age=31536000; includeSubDomains'
-    response.headers['Content-Security-Policy'] = (
+SECURITY_HEADERS = {
+    'X-Content-Type-Options': 'nosniff',
+    'X-Frame-Options': 'DENY',
+    'X-XSS-Protection': '1; mode=block',
+    'Strict-Transport-Security': 'max-age=31536000; includeSubDomains',
+    'Content-Security-Policy': (
         "default-src 'self'; "
         "style-src 'self' 'unsafe-inline' https://cdn.jsdelivr.net https://cdnjs.cloudflare.com https://fonts.googleapis.com; "
         "font-src 'self' https://fonts.gstatic.com https://cdnjs.cloudflare.com; "
         "script-src 'self' https://cdn.jsdelivr.net; "
         "img-src 'self' data:; "
         "connect-src 'self'"
-    )
-    response.headers['Referrer-Policy'] = 'strict-origin-when-cross-origin'
+    ),
+    'Referrer-Policy': 'strict-origin-when-cross-origin',
+}
+
+@app.after_request
+def set_security_headers(response):
+    """Set security headers"""
+    response.headers.update(SECURITY_HEADERS)
     return response
 
 # Error handlers
@@ -170,7 +352,7 @@ def index():
             form = LoginForm()
             if form.validate_on_submit():
                 password = sanitize_input(form.access_password.data)
-                if password == get_form_password():
+                if password_matches(password, get_form_password()):
                     session['form_access'] = True
                     session.permanent = True
                     logger.info(f"Successful form login from {get_remote_address()}")
@@ -201,21 +383,26 @@ def index():
                 flash("La frase indizio deve essere di almeno 10 caratteri", 'error')
                 return render_template('index.html', form=form)
             
-            # Check for duplicates (simple anti-spam)
+            # Save to database with parameterized query (SQL injection protection),
+            # skipping the insert if the same contribution exists (simple anti-spam).
+            # Words are stored lowercase and looked up lowercase: NOCASE only folds
+            # ASCII, so it would miss e.g. 'PERCHÈ' against a stored 'perchè'.
+            parola_lc = parola.lower()
             conn = get_db_connection()
-            existing = conn.execute('SELECT * FROM submissions WHERE parola = ? AND frase_indizio = ?', 
-                                   (parola.lower(), frase_indizio)).fetchone()
-            if existing:
+            try:
+                inserted = conn.execute('''INSERT INTO submissions (parola, frase_indizio, nome)
+                                           SELECT ?, ?, ?
+                                           WHERE NOT EXISTS (SELECT 1 FROM submissions
+                                                             WHERE parola = ? COLLATE NOCASE AND frase_indizio = ?)''',
+                                        (parola_lc, frase_indizio, nome, parola_lc, frase_indizio)).rowcount
+            except sqlite3.IntegrityError:
+                # The unique index caught a duplicate the lookup did not see
+                inserted = 0
+            conn.commit()
+            if not inserted:
                 flash("Questo contributo è già stato registrato", 'error')
-                conn.close()
                 return render_template('index.html', form=form)
             
-            # Save to database with parameterized query (SQL injection protection)
-            conn.execute('INSERT INTO submissions (parola, frase_indizio, nome) VALUES (?, ?, ?)',
-                        (parola.lower(), frase_indizio, nome))
-            conn.commit()
-            conn.close()
-            
             logger.info(f"New contribution from {get_remote_address()}: {parola[:10]}...")
             flash("Grazie! Il tuo contributo è stato registrato.", 'success')
             return render_template('success.html', nome=nome)
@@ -240,7 +427,7 @@ def admin():
         form = AdminLoginForm()
         if form.validate_on_submit():
             password = sanitize_input(form.password.data)
-            if password == get_admin_password():
+            if password_matches(password, get_admin_password()):
                 session['admin_logged_in'] = True
                 session.permanent = True
                 logger.info(f"Successful admin login from {get_remote_address()}")
@@ -254,48 +441,74 @@ def admin():
         form = AdminLoginForm()
         return render_template('admin_login.html', form=form)
     
+    page = max(request.args.get('page', 1, type=int), 1)
+    size = min(max(request.args.get('size', ADMIN_PAGE_SIZE, type=int), 1), ADMIN_MAX_PAGE_SIZE)
+    
     conn = get_db_connection()
-    submissions = conn.execute('SELECT * FROM submissions ORDER BY timestamp DESC').fetchall()
-    conn.close()
+    last_id, total = conn.execute('SELECT COALESCE(MAX(id), 0), COUNT(*) FROM submissions').fetchone()
+    # Pages past the end show the last one (and keep the OFFSET within SQLite's range)
+    pages = max(-(-total // size), 1)
+    page = min(page, pages)
     
-    return render_template('admin.html', submissions=submissions)
+    # Skip the page query and rendering when the client's copy is current;
+    # pending flash messages always need a fresh render to be shown
+    generate_csrf()
+    etag = admin_etag(last_id, total, page, size)
+    if '_flashes' not in session and request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        # The session is saved before the streamed body renders, so pop pending
+        # flashes now; the template's get_flashed_messages() reuses this request's copy
+        get_flashed_messages()
+        # The template is streamed while rows are read from the cursor
+        submissions = conn.execute('SELECT * FROM submissions ORDER BY timestamp DESC LIMIT ? OFFSET ?',
+                                   (size, (page - 1) * size))
+        response = Response(stream_template(
+            'admin.html', submissions=submissions, total=total,
+            named=count_named_submissions(last_id, total),
+            page=page, pages=pages, size=size))
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 @app.route('/admin/export')
 @limiter.limit("10 per minute")
+@admin_required
 def export_csv():
-    if not session.get('admin_logged_in'):
-        abort(403)
-    
     try:
         conn = get_db_connection()
-        submissions = conn.execute('SELECT parola, frase_indizio, nome, timestamp FROM submissions ORDER BY timestamp DESC').fetchall()
-        conn.close()
+        submissions = conn.execute('SELECT parola, frase_indizio, nome, timestamp FROM submissions ORDER BY timestamp DESC')
         
-        output = []
-        output.append(['Parola', 'Frase Indizio', 'Nome', 'Data'])
-        for submission in submissions:
-            output.append([
-                submission['parola'],
-                submission['frase_indizio'],
-                submission['nome'] or 'Anonimo',
-                submission['timestamp']
-            ])
+        def generate():
+            # Rows are read lazily from the cursor and written one at a time
+            output_stream = io.StringIO()
+            writer = csv.writer(output_stream)
+            writer.writerow(['Parola', 'Frase Indizio', 'Nome', 'Data'])
+            try:
+                for submission in submissions:
+                    writer.writerow([
+                        submission['parola'],
+                        submission['frase_indizio'],
+                        submission['nome'] or 'Anonimo',
+                        submission['timestamp']
+                    ])
+                    yield output_stream.getvalue()
+                    output_stream.seek(0)
+                    output_stream.truncate()
+            except Exception as e:
+                # The response has already started, so the error can no longer
+                # be flashed: log it and cut the download short
+                logger.error(f"CSV export error while streaming: {e}")
+                raise
+            yield output_stream.getvalue()
         
-        # Create CSV response
-        response = make_response()
-        response.headers['Content-Type'] = 'text/csv; charset=utf-8'
+        # Create streamed CSV response
+        response = Response(stream_with_context(generate()), content_type='text/csv; charset=utf-8')
         response.headers['Content-Disposition'] = 'attachment; filename=cruciverba_bianca.csv'
         response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
         response.headers['Pragma'] = 'no-cache'
         response.headers['Expires'] = '0'
         
-        # Write CSV data
-        import io
-        output_stream = io.StringIO()
-        writer = csv.writer(output_stream)
-        writer.writerows(output)
-        response.data = output_stream.getvalue().encode('utf-8')
-        
         logger.info(f"CSV export by admin from {get_remote_address()}")
         return response
     except Exception as e:
@@ -303,28 +516,19 @@ def export_csv():
         flash("Errore durante l'esportazione", 'error')
         return redirect(url_for('admin'))
 
-@app.route('/admin/delete/<int:submission_id>', methods=['POST'])
+@app.route('/admin/delete/<posint:submission_id>', methods=['POST'])
 @limiter.limit("30 per minute")
+@admin_required
 def delete_submission(submission_id):
-    if not session.get('admin_logged_in'):
-        abort(403)
-    
     try:
-        # Validate submission_id
-        if submission_id <= 0:
-            abort(400)
-            
         conn = get_db_connection()
-        # Check if submission exists first
-        result = conn.execute('SELECT id FROM submissions WHERE id = ?', (submission_id,)).fetchone()
-        if not result:
+        # Take the write lock up front instead of upgrading from a read lock
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            deleted = conn.execute('DELETE FROM submissions WHERE id = ?', (submission_id,)).rowcount
+        if not deleted:
             flash("Contributo non trovato", 'error')
-            conn.close()
             return redirect(url_for('admin'))
-            
-        conn.execute('DELETE FROM submissions WHERE id = ?', (submission_id,))
-        conn.commit()
-        conn.close()
         
         logger.info(f"Submission {submission_id} deleted by admin from {get_remote_address()}")
         flash("Contributo eliminato", 'success')
@@ -348,5 +552,7 @@ def form_logout():
     return redirect(url_for('index'))
 
 if __name__ == '__main__':
+    # Development server only; production runs under gunicorn (see gunicorn_conf.py)
     init_db()
-    app.run(host='0.0.0.0', port=5000, debug=True) 
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5000,
+            debug=os.getenv('FLASK_DEBUG', 'False').lower() == 'true') 
\ No newline at end of file
@@ -0,0 +1,11 @@
+"""
+Shared pytest configuration for the Cruciverba test suite.
+"""
+
+import os
+import sys
+
+# app.py is a top-level module, not an installed package: make it importable
+# once for every test module (and every pytest-xdist worker)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
@@ -0,0 +1,28 @@
+"""
+Gunicorn configuration for the Cruciverba application.
+
+Usage:
+    gunicorn -c gunicorn_conf.py app:app
+"""
+
+import multiprocessing
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+
+# Threaded workers: each thread keeps its own pooled SQLite connection.
+# WAL mode lets reads run concurrently; SQLite still serializes writers, and
+# the connection's busy_timeout (5s) makes a writer wait for the lock
+# instead of failing with "database is locked".
+worker_class = 'gthread'
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+
+# Log to stdout/stderr like the application's own stream handler
+accesslog = '-'
+errorlog = '-'
+
+def post_worker_init(worker):
+    """Create the database schema (idempotent) once the app is loaded"""
+    from app import init_db
+    init_db()
@@ -1,25 +1,68 @@
 import pytest
+import re
 import sqlite3
-import os
-import sys
-import tempfile
-sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from flask.sessions import SecureCookieSessionInterface
 
-from app import app as cruciverba_app, get_form_password, get_admin_password, sanitize_input, is_valid_word, is_valid_clue, get_db_connection
+import app as _app_mod
+from app import app as cruciverba_app, get_form_password, get_admin_password, sanitize_input, is_valid_word, is_valid_clue
+from app import limiter, csrf
 
-# Global test database
-test_db_path = None
+SESSION_COOKIE = cruciverba_app.config['SESSION_COOKIE_NAME']
+
+# Valid form payload; tests override only the fields they exercise
+_BASE = {
+    'parola': 'TEST',
+    'frase_indizio': 'Una frase indizio molto lunga per test',
+    'nome': 'Test'
+}
+
+# Form payloads each lacking at least one required field
+MISSING_FIELDS_PAYLOADS = (
+    {'frase_indizio': _BASE['frase_indizio'], 'nome': 'Test'},
+    {'parola': 'TEST', 'nome': 'Test'},
+    {'nome': 'Test'},
+)
+
+# Injected script payload, searched for in raw response bodies
+_XSS_RE = re.compile(rb'alert\("xss"\)')
+
+def _seed(conn, rows):
+    """Insert (parola, frase_indizio, nome) rows in a single transaction."""
+    conn.execute('BEGIN')
+    conn.executemany('INSERT INTO submissions (parola, frase_indizio, nome) VALUES (?, ?, ?)', rows)
+    conn.commit()
+
+class SharedConnection(sqlite3.Connection):
+    """Connection shared by the whole test session; close() is a no-op."""
+    
+    def close(self):
+        pass
+
+# Shared in-memory test database: every connection to this URI sees the same data
+TEST_DB_URI = 'file:testdb?mode=memory&cache=shared'
+
+@pytest.fixture(scope="session", autouse=True)
+def _test_config():
+    """Put the application in test mode once for the whole session."""
+    cruciverba_app.config.update(TESTING=True, WTF_CSRF_ENABLED=False, PROPAGATE_EXCEPTIONS=False)
+    # Disable rate limiting for tests
+    limiter.enabled = False
+    yield
+    limiter.enabled = True
 
 @pytest.fixture(scope="session")
 def test_database():
-    """Create a temporary database for the entire test session."""
-    global test_db_path
-    fd, test_db_path = tempfile.mkstemp()
-    os.close(fd)
+    """Create a shared in-memory database for the entire test session."""
+    # This connection owns the database; it lives until the end of the session
+    conn = sqlite3.connect(TEST_DB_URI, uri=True)
+    conn.row_factory = sqlite3.Row
+    conn.executescript('''
+        PRAGMA journal_mode = MEMORY;
+        PRAGMA synchronous = OFF;
+        PRAGMA temp_store = MEMORY;
+    ''')
     
     # Initialize the database with the table
-    conn = sqlite3.connect(test_db_path)
-    conn.row_factory = sqlite3.Row
     conn.execute('''
         CREATE TABLE IF NOT EXISTS submissions (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -29,55 +72,89 @@ def test_database():
             timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
         )
     ''')
+    conn.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_sub_lc
+        ON submissions (parola COLLATE NOCASE, frase_indizio)
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_sub_ts ON submissions (timestamp DESC)')
     conn.commit()
-    conn.close()
     
-    yield test_db_path
+    yield TEST_DB_URI
     
-    # Cleanup
-    os.unlink(test_db_path)
+    # Closing the last connection discards the database
+    conn.close()
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def client(test_database):
-    """Create a test client for the Flask application."""
-    cruciverba_app.config['TESTING'] = True
-    cruciverba_app.config['WTF_CSRF_ENABLED'] = False
-    
-    # Disable rate limiting for tests
-    from app import limiter
-    limiter.enabled = False
+    """Create a test client shared by the whole test session."""
+    # Override the get_db_connection function for testing: every test and
+    # request reuses one connection, which the routes' close() calls leave open
+    shared_conn = sqlite3.connect(test_database, uri=True, check_same_thread=False,
+                                  factory=SharedConnection)
+    shared_conn.row_factory = sqlite3.Row
+    shared_conn.execute('PRAGMA locking_mode = EXCLUSIVE')
     
-    # Override the get_db_connection function for testing
     def get_test_db():
-        conn = sqlite3.connect(test_database)
-        conn.row_factory = sqlite3.Row
-        return conn
+        return shared_conn
     
     # Store original function to restore later  
-    import app
-    original_get_db = app.get_db_connection
-    app.get_db_connection = get_test_db
+    original_get_db = _app_mod.get_db_connection
+    _app_mod.get_db_connection = get_test_db
+    
+    # Keep sessions in signed cookies so tests don't need a Redis server
+    original_session_interface = cruciverba_app.session_interface
+    cruciverba_app.session_interface = SecureCookieSessionInterface()
     
     with cruciverba_app.test_client() as client:
         with cruciverba_app.app_context():
             yield client
     
-    # Restore original function and re-enable rate limiting
-    app.get_db_connection = original_get_db
-    limiter.enabled = True
+    # Restore original function and session store
+    _app_mod.get_db_connection = original_get_db
+    sqlite3.Connection.close(shared_conn)
+    cruciverba_app.session_interface = original_session_interface
+
+@pytest.fixture(autouse=True)
+def _reset_db(client):
+    """Empty the submissions table and the session after each test."""
+    yield
+    conn = _app_mod.get_db_connection()
+    conn.execute('DELETE FROM submissions')
+    conn.commit()
+    conn.close()
+    client.delete_cookie(SESSION_COOKIE)
+
+@pytest.fixture(scope="session")
+def form_password():
+    """Form access password, looked up once per session."""
+    return get_form_password()
+
+@pytest.fixture(scope="session")
+def admin_password():
+    """Admin password, looked up once per session."""
+    return get_admin_password()
+
+@pytest.fixture(scope="session")
+def session_cookies(client):
+    """Signed session cookies for form and admin access, built once per session."""
+    cookies = {}
+    for key in ('form_access', 'admin_logged_in'):
+        throwaway = cruciverba_app.test_client()
+        with throwaway.session_transaction() as sess:
+            sess[key] = True
+        cookies[key] = throwaway.get_cookie(SESSION_COOKIE).value
+    return cookies
 
 @pytest.fixture
-def authenticated_session(client):
+def authenticated_session(client, session_cookies):
     """Create an authenticated session for form access."""
-    with client.session_transaction() as sess:
-        sess['form_access'] = True
+    client.set_cookie(SESSION_COOKIE, session_cookies['form_access'])
     return client
 
 @pytest.fixture
-def admin_session(client):
+def admin_session(client, session_cookies):
     """Create an authenticated admin session."""
-    with client.session_transaction() as sess:
-        sess['admin_logged_in'] = True
+    client.set_cookie(SESSION_COOKIE, session_cookies['admin_logged_in'])
     return client
 
 class TestSecurityHeaders:
@@ -106,6 +183,42 @@ class TestSecurityHeaders:
         with client.session_transaction() as sess:
             assert sess.get('test') == 'value'
 
+@pytest.fixture
+def redis_server(client, monkeypatch):
+    """Serve sessions from a fake Redis, configured like the application's store."""
+    fakeredis = pytest.importorskip('fakeredis')
+    from flask_session import Session
+    server = fakeredis.FakeServer()
+    monkeypatch.setitem(cruciverba_app.config, 'SESSION_REDIS', fakeredis.FakeRedis(server=server))
+    # Restored on teardown; Session() replaces it with a Redis-backed interface
+    monkeypatch.setattr(cruciverba_app, 'session_interface', cruciverba_app.session_interface)
+    Session(cruciverba_app)
+    return server
+
+class TestRedisSessions:
+    """Test the server-side Redis session store."""
+    
+    def test_login_stored_in_redis(self, client, redis_server, form_password):
+        """Test that the session lives in Redis and the cookie only carries its id."""
+        response = client.post('/', data={'access_password': form_password})
+        assert response.status_code == 302
+        
+        keys = cruciverba_app.session_interface.redis.keys('cruciverba:session:*')
+        assert len(keys) == 1
+        sid = keys[0].decode()[len('cruciverba:session:'):]
+        cookie = client.get_cookie(SESSION_COOKIE).value
+        # Signed session id, not the serialized session
+        assert cookie.startswith(sid + '.')
+        
+        response = client.get('/')
+        assert b'name="parola"' in response.data
+    
+    def test_redis_outage(self, client, redis_server):
+        """Test that pages using the session fail while Redis is unreachable."""
+        redis_server.connected = False
+        response = client.get('/')
+        assert response.status_code == 500
+
 class TestAuthentication:
     """Test authentication mechanisms."""
     
@@ -113,11 +226,11 @@ class TestAuthentication:
         """Test that form access requires password."""
         response = client.get('/')
         assert response.status_code == 200
-        assert 'Password' in response.get_data(as_text=True)
+        assert b'Password' in response.data
     
-    def test_form_login_success(self, client):
+    def test_form_login_success(self, client, form_password):
         """Test successful form login."""
-        response = client.post('/', data={'access_password': get_form_password()})
+        response = client.post('/', data={'access_password': form_password})
         # Should redirect or show form page
         assert response.status_code in [200, 302]
     
@@ -125,18 +238,18 @@ class TestAuthentication:
         """Test failed form login."""
         response = client.post('/', data={'access_password': 'wrong_password'})
         assert response.status_code == 200
-        assert 'Password errata' in response.get_data(as_text=True)
+        assert b'Password errata' in response.data
     
-    def test_admin_login_success(self, client):
+    def test_admin_login_success(self, client, admin_password):
         """Test successful admin login."""
-        response = client.post('/admin', data={'password': get_admin_password()})
+        response = client.post('/admin', data={'password': admin_password})
         assert response.status_code in [200, 302]  # Success or redirect
     
     def test_admin_login_failure(self, client):
         """Test failed admin login."""
         response = client.post('/admin', data={'password': 'wrong_password'})
         assert response.status_code == 200
-        assert 'Password errata' in response.get_data(as_text=True)
+        assert b'Password errata' in response.data
     
     def test_form_logout(self, authenticated_session):
         """Test form logout functionality."""
@@ -146,7 +259,7 @@ class TestAuthentication:
         
         # Verify we're logged out by trying to access form
         response = authenticated_session.get('/')
-        assert 'Password' in response.get_data(as_text=True)
+        assert b'Password' in response.data
     
     def test_admin_logout(self, admin_session):
         """Test admin logout functionality."""
@@ -159,6 +272,7 @@ class TestFormSubmission:
     def test_valid_submission(self, authenticated_session):
         """Test valid form submission."""
         data = {
+            **_BASE,
             'parola': 'AMORE',
             'frase_indizio': 'Sentimento che prova per il futuro marito',
             'nome': 'Maria'
@@ -168,63 +282,45 @@ class TestFormSubmission:
         assert response.status_code == 200
         
         # Should show success page with user's name
-        page_content = response.get_data(as_text=True)
-        assert 'Grazie Maria!' in page_content
+        page_content = response.data
+        assert b'Grazie Maria!' in page_content
     
     def test_missing_required_fields(self, authenticated_session):
         """Test submission with missing required fields."""
-        # Missing parola
-        data = {
-            'frase_indizio': 'Una frase indizio molto lunga per test',
-            'nome': 'Test'
-        }
-        response = authenticated_session.post('/', data=data)
-        assert response.status_code == 200
-        
-        # Missing frase_indizio
-        data = {
-            'parola': 'TEST',
-            'nome': 'Test'
-        }
-        response = authenticated_session.post('/', data=data)
-        assert response.status_code == 200
-        
-        # Both missing (nome is optional)
-        data = {
-            'nome': 'Test'
-        }
-        response = authenticated_session.post('/', data=data)
-        assert response.status_code == 200
+        # Missing parola, missing frase_indizio, both missing
+        for data in MISSING_FIELDS_PAYLOADS:
+            response = authenticated_session.post('/', data=data)
+            assert response.status_code == 200
     
     def test_invalid_word_characters(self, authenticated_session):
         """Test submission with invalid characters in word."""
         data = {
+            **_BASE,
             'parola': 'TEST123!@#',  # Invalid characters
-            'frase_indizio': 'Una frase indizio abbastanza lunga',
-            'nome': 'Test'
+            'frase_indizio': 'Una frase indizio abbastanza lunga'
         }
         
         response = authenticated_session.post('/', data=data)
         assert response.status_code == 200
-        page_content = response.get_data(as_text=True)
-        assert 'La parola può contenere solo lettere' in page_content
+        page_content = response.data
+        assert 'La parola può contenere solo lettere'.encode() in page_content
     
     def test_short_clue(self, authenticated_session):
         """Test submission with too short clue."""
         data = {
-            'parola': 'TEST',
-            'frase_indizio': 'Short',  # Too short
-            'nome': 'Test'
+            **_BASE,
+            'frase_indizio': 'Short'  # Too short
         }
         
         response = authenticated_session.post('/', data=data)
         assert response.status_code == 200
-        page_content = response.get_data(as_text=True)
-        assert 'almeno 10 caratteri' in page_content
+        page_content = response.data
+        assert b'almeno 10 caratteri' in page_content
     
     def test_duplicate_submission(self, authenticated_session):
         """Test duplicate submission prevention."""
         data = {
+            **_BASE,
             'parola': 'DUPLICATE',
             'frase_indizio': 'Una frase indizio molto lunga per evitare errori',
             'nome': 'Test User'
@@ -237,15 +333,41 @@ class TestFormSubmission:
         # Second identical submission should be rejected
         response = authenticated_session.post('/', data=data)
         assert response.status_code == 200
-        page_content = response.get_data(as_text=True)
-        assert 'già stato registrato' in page_content
+        page_content = response.data
+        assert 'già stato registrato'.encode() in page_content
+    
+    @pytest.mark.parametrize("first,second", [
+        ('AMORE', 'amore'),
+        ('Amore', 'AMORE'),
+        ('PERCHÈ', 'PERCHÈ'),  # NOCASE alone does not fold non-ASCII letters
+        ('Città', 'CITTÀ'),
+    ])
+    def test_duplicate_submission_ignores_case(self, authenticated_session, first, second):
+        """Test that a word resubmitted in a different case is a duplicate."""
+        response = authenticated_session.post('/', data={**_BASE, 'parola': first})
+        assert b'Grazie Test!' in response.data
+        
+        response = authenticated_session.post('/', data={**_BASE, 'parola': second})
+        assert response.status_code == 200
+        assert 'già stato registrato'.encode() in response.data
+        
+        conn = _app_mod.get_db_connection()
+        assert conn.execute('SELECT COUNT(*) FROM submissions').fetchone()[0] == 1
+    
+    def test_same_word_different_clue(self, authenticated_session):
+        """Test that the same word with another clue is not a duplicate."""
+        response = authenticated_session.post('/', data=_BASE)
+        assert b'Grazie Test!' in response.data
+        
+        response = authenticated_session.post('/', data={**_BASE, 'frase_indizio': 'Un altro indizio per la stessa parola'})
+        assert b'Grazie Test!' in response.data
     
     def test_honeypot_protection(self, authenticated_session):
         """Test honeypot spam protection."""
         data = {
+            **_BASE,
             'parola': 'HONEYPOT',
             'frase_indizio': 'Una frase indizio molto lunga per honeypot test',
-            'nome': 'Test',
             'website': 'http://spam.com'  # Honeypot field
         }
         
@@ -256,44 +378,17 @@ class TestFormSubmission:
 class TestInputSanitization:
     """Test input sanitization and XSS prevention."""
     
-    def test_xss_prevention_in_parola(self, authenticated_session):
-        """Test XSS prevention in parola field."""
-        data = {
-            'parola': '<script>alert("xss")</script>TEST',
-            'frase_indizio': 'Una frase indizio molto lunga per test XSS',
-            'nome': 'Test'
-        }
-        
-        response = authenticated_session.post('/', data=data)
-        page_content = response.get_data(as_text=True)
-        # Check that malicious script content is not present in user data areas
-        assert 'alert("xss")' not in page_content
-    
-    def test_xss_prevention_in_frase_indizio(self, authenticated_session):
-        """Test XSS prevention in frase_indizio field."""
-        data = {
-            'parola': 'TEST',
-            'frase_indizio': '<script>alert("xss")</script>Una frase indizio molto lunga',
-            'nome': 'Test'
-        }
-        
-        response = authenticated_session.post('/', data=data)
-        page_content = response.get_data(as_text=True)
-        # Check that malicious script content is not present in user data areas
-        assert 'alert("xss")' not in page_content
-    
-    def test_xss_prevention_in_nome(self, authenticated_session):
-        """Test XSS prevention in nome field."""
-        data = {
-            'parola': 'TEST',
-            'frase_indizio': 'Una frase indizio molto lunga per test',
-            'nome': '<script>alert("xss")</script>TestUser'
-        }
-        
+    @pytest.mark.parametrize("data", [
+        {**_BASE, 'parola': '<script>alert("xss")</script>TEST'},
+        {**_BASE, 'frase_indizio': '<script>alert("xss")</script>Una frase indizio molto lunga'},
+        {**_BASE, 'nome': '<script>alert("xss")</script>TestUser'},
+    ], ids=['parola', 'frase_indizio', 'nome'])
+    def test_xss_prevention(self, authenticated_session, data):
+        """Test XSS prevention in each form field."""
         response = authenticated_session.post('/', data=data)
-        page_content = response.get_data(as_text=True)
+        page_content = response.data
         # Check that malicious script content is not present in user data areas
-        assert 'alert("xss")' not in page_content
+        assert _XSS_RE.search(page_content) is None
 
 class TestAdminFunctionality:
     """Test admin panel functionality."""
@@ -302,21 +397,83 @@ class TestAdminFunctionality:
         """Test admin dashboard access with authentication."""
         response = admin_session.get('/admin')
         assert response.status_code == 200
-        assert 'Pannello Amministratore' in response.get_data(as_text=True)
+        assert b'Pannello Amministratore' in response.data
+    
+    def test_admin_dashboard_pagination(self, admin_session):
+        """Test that the admin dashboard shows one page of submissions at a time."""
+        conn = _app_mod.get_db_connection()
+        _seed(conn, [('pagina', f'indizio per la paginazione {i}', 'Test User') for i in range(3)])
+        conn.close()
+        
+        response = admin_session.get('/admin?page=2&size=1')
+        assert response.status_code == 200
+        page_content = response.data
+        assert page_content.count(b'/admin/delete/') == 1
+        assert b'Pagina 2 di' in page_content
+        
+        # Pages past the end (even beyond SQLite's integer range) show the last one
+        response = admin_session.get('/admin?page=99999999999999999999&size=1')
+        assert response.status_code == 200
+        page_content = response.data
+        assert page_content.count(b'/admin/delete/') == 1
+        assert b'Pagina 3 di 3' in page_content
+    
+    def test_admin_dashboard_counts(self, admin_session):
+        """Test the named and anonymous submission totals."""
+        conn = _app_mod.get_db_connection()
+        _seed(conn, [('nome', 'indizio con un nome per il conteggio', 'Maria'),
+                     ('vuoto', 'indizio con un nome vuoto dopo la pulizia', ''),
+                     ('nullo', 'indizio senza alcun nome per il conteggio', None)])
+        conn.close()
+        
+        response = admin_session.get('/admin')
+        assert response.status_code == 200
+        page_content = response.data
+        assert re.search(rb'<h5>1</h5>\s*<small>Con Nome</small>', page_content)
+        assert re.search(rb'<h5>2</h5>\s*<small>Anonimi</small>', page_content)
+    
+    def test_admin_dashboard_not_modified(self, admin_session):
+        """Test that an unchanged admin dashboard is answered with 304."""
+        response = admin_session.get('/admin')
+        assert response.status_code == 200
+        assert b'Pannello Amministratore' in response.data
+        etag = response.headers['ETag']
+        
+        response = admin_session.get('/admin', headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        assert response.headers['ETag'] == etag
+        
+        # A new submission changes the ETag
+        conn = _app_mod.get_db_connection()
+        _seed(conn, [('etag', 'indizio per il test etag', 'Test User')])
+        conn.close()
+        response = admin_session.get('/admin', headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert b'ETAG' in response.data
     
     def test_admin_dashboard_without_auth(self, client):
         """Test admin dashboard access without authentication."""
         response = client.get('/admin')
         assert response.status_code == 200
-        assert 'Password' in response.get_data(as_text=True)
+        assert b'Password' in response.data
     
     def test_csv_export_with_auth(self, admin_session):
         """Test CSV export with authentication."""
+        conn = _app_mod.get_db_connection()
+        _seed(conn, [('amore', 'Sentimento che prova per il futuro marito', 'Maria'),
+                     ('gioia', 'Sentimento che trasmette sempre', None)])
+        
         response = admin_session.get('/admin/export')
-        # Should succeed (200) or redirect with error (302)
-        assert response.status_code in [200, 302]
-        if response.status_code == 200:
-            assert response.headers['Content-Type'] == 'text/csv; charset=utf-8'
+        assert response.status_code == 200
+        assert response.headers['Content-Type'] == 'text/csv; charset=utf-8'
+        
+        lines = response.data.decode('utf-8').splitlines()
+        assert lines[0] == 'Parola,Frase Indizio,Nome,Data'
+        assert len(lines) == 3
+        # Rows may come in either order (same timestamp); drop the Data column
+        rows = {line.rsplit(',', 1)[0] for line in lines[1:]}
+        assert rows == {'amore,Sentimento che prova per il futuro marito,Maria',
+                        'gioia,Sentimento che trasmette sempre,Anonimo'}
     
     def test_csv_export_without_auth(self, client):
         """Test CSV export without authentication."""
@@ -326,11 +483,8 @@ class TestAdminFunctionality:
     def test_delete_submission_with_auth(self, admin_session):
         """Test submission deletion with authentication."""
         # First create a submission to delete
-        import app
-        conn = app.get_db_connection()
-        conn.execute('INSERT INTO submissions (parola, frase_indizio, nome) VALUES (?, ?, ?)',
-                    ('testdelete', 'test indizio abbastanza lungo', 'Test User'))
-        conn.commit()
+        conn = _app_mod.get_db_connection()
+        _seed(conn, [('testdelete', 'test indizio abbastanza lungo', 'Test User')])
         
         # Get the submission ID
         submission = conn.execute('SELECT id FROM submissions WHERE parola = ?', ('testdelete',)).fetchone()
@@ -340,53 +494,65 @@ class TestAdminFunctionality:
         # Test deletion
         response = admin_session.post(f'/admin/delete/{submission_id}')
         assert response.status_code == 302  # Should redirect with error message
+        
+        # The confirmation is flashed on the next dashboard view only
+        assert b'Contributo eliminato' in admin_session.get('/admin').data
+        response = admin_session.get('/admin')
+        assert b'Contributo eliminato' not in response.data
+        etag = response.headers['ETag']
+        assert admin_session.get('/admin', headers={'If-None-Match': etag}).status_code == 304
     
     def test_delete_nonexistent_submission(self, admin_session):
         """Test deletion of non-existent submission."""
         response = admin_session.post('/admin/delete/99999')
         assert response.status_code == 302  # Should redirect with error message
 
-class TestRateLimiting:
-    """Test rate limiting functionality."""
-    
-    def test_rate_limiting_configured(self, client):
-        """Test that rate limiting is properly configured."""
-        # Verify that the limiter is being used (import from app module)
-        from app import limiter
-        assert limiter is not None
-        
-        # In actual deployment, rate limiting would work
-        # In tests, we disable it for easier testing
-
 class TestDatabaseOperations:
     """Test database operations."""
     
-    def test_database_initialization(self):
+    def test_database_initialization(self, test_database):
         """Test database initialization."""
-        # Create temporary database
-        conn = sqlite3.connect(':memory:')
-        conn.row_factory = sqlite3.Row
-        
-        # Test table creation
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS submissions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                parola TEXT NOT NULL,
-                frase_indizio TEXT NOT NULL,
-                nome TEXT,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
+        conn = sqlite3.connect(test_database, uri=True)
         
         # Verify table exists
         cursor = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='submissions'")
         assert cursor.fetchone() is not None
         conn.close()
     
+    def test_init_db_removes_duplicates(self, tmp_path, monkeypatch):
+        """Test that init_db drops old duplicate rows before building the unique index."""
+        db_path = tmp_path / 'cruciverba.db'
+        monkeypatch.setenv('DATABASE_PATH', str(db_path))
+        
+        # A database from before the unique index, with racing duplicates
+        conn = sqlite3.connect(db_path)
+        conn.execute('''CREATE TABLE submissions
+                        (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                         parola TEXT NOT NULL,
+                         frase_indizio TEXT NOT NULL,
+                         nome TEXT,
+                         timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)''')
+        _seed(conn, [('amore', 'Sentimento che prova per il futuro marito', 'Maria'),
+                     ('amore', 'Sentimento che prova per il futuro marito', 'Maria'),
+                     ('gioia', 'Sentimento che trasmette sempre', 'Mario')])
+        conn.close()
+        
+        _app_mod.init_db()
+        
+        conn = sqlite3.connect(db_path)
+        rows = conn.execute('SELECT id, parola FROM submissions ORDER BY id').fetchall()
+        assert rows == [(1, 'amore'), (3, 'gioia')]
+        assert conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_sub_lc'").fetchone()
+        conn.close()
+        
+        # Running it again on the migrated database is a no-op
+        _app_mod.init_db()
+    
     def test_submission_storage(self, authenticated_session):
         """Test that submissions are properly stored in database."""
         # Use a unique word for this test
         data = {
+            **_BASE,
             'parola': 'FELICITA',
             'frase_indizio': 'Stato d\'animo sempre presente in lei con questa emozione',
             'nome': 'Test Storage User'
@@ -394,11 +560,10 @@ class TestDatabaseOperations:
         
         response = authenticated_session.post('/', data=data)
         assert response.status_code == 200
-        assert 'Grazie Test Storage User!' in response.get_data(as_text=True)
+        assert b'Grazie Test Storage User!' in response.data
         
         # Verify in database (words are stored in lowercase)
-        import app
-        conn = app.get_db_connection()
+        conn = _app_mod.get_db_connection()
         submission = conn.execute('SELECT * FROM submissions WHERE parola = ? AND nome = ?', 
                                  ('felicita', 'Test Storage User')).fetchone()
         assert submission is not None
@@ -413,6 +578,7 @@ class TestSuccessPage:
     def test_success_page_display(self, authenticated_session):
         """Test success page displays correctly after submission."""
         data = {
+            **_BASE,
             'parola': 'GIOIA',
             'frase_indizio': 'Sentimento che trasmette sempre',
             'nome': 'Mario Rossi'
@@ -422,16 +588,17 @@ class TestSuccessPage:
         assert response.status_code == 200
         
         # Check success page elements
-        page_content = response.get_data(as_text=True)
-        assert 'Grazie Mario Rossi!' in page_content
-        assert 'Aggiungi un\'altra parola' in page_content
-        assert 'Finito, disconnetti' in page_content
-        assert 'Contributo salvato!' in page_content
+        page_content = response.data
+        assert b'Grazie Mario Rossi!' in page_content
+        assert b'Aggiungi un\'altra parola' in page_content
+        assert b'Finito, disconnetti' in page_content
+        assert b'Contributo salvato!' in page_content
     
     def test_add_another_word_link(self, authenticated_session):
         """Test that add another word link works."""
         # First submission
         data = {
+            **_BASE,
             'parola': 'SORRISO',
             'frase_indizio': 'Espressione sempre presente sul suo volto',
             'nome': 'Mario Rossi'
@@ -443,7 +610,7 @@ class TestSuccessPage:
         # Check that we can access the form again
         response = authenticated_session.get('/')
         assert response.status_code == 200
-        assert 'Parola' in response.get_data(as_text=True)
+        assert b'Parola' in response.data
 
 class TestErrorHandling:
     """Test error handling and edge cases."""
@@ -453,69 +620,76 @@ class TestErrorHandling:
         response = client.get('/nonexistent-page')
         assert response.status_code == 404
     
-    def test_csrf_error_handling(self, client):
-        """Test CSRF error handling."""
-        # This would need CSRF enabled and proper token testing
-        # For now, verify that CSRF protection exists (import from app module)
-        from app import csrf
-        assert csrf is not None
-    
     def test_invalid_submission_id(self, admin_session):
         """Test handling of invalid submission ID."""
         response = admin_session.post('/admin/delete/invalid')
         assert response.status_code == 404
+    
+    def test_non_positive_submission_id(self, admin_session):
+        """Test that zero and zero-padded submission IDs are not routed."""
+        assert admin_session.post('/admin/delete/0').status_code == 404
+        assert admin_session.post('/admin/delete/007').status_code == 404
 
-class TestConfigurationAndEnvironment:
-    """Test configuration and environment variables."""
+class TestSmoke:
+    """Cheap checks on how the application module is wired."""
     
-    def test_environment_variables(self):
-        """Test environment variable handling."""
-        # Test password functions
+    def test_module_wiring(self):
+        """Test that extensions and configuration helpers are in place."""
+        # Rate limiting and CSRF protection exist (the limiter is disabled in tests)
+        assert limiter is not None
+        assert csrf is not None
+        
+        # Password functions return non-empty strings
         assert callable(get_form_password)
         assert callable(get_admin_password)
-        
-        # Test default values
-        form_password = get_form_password()
-        admin_password = get_admin_password()
-        
-        assert isinstance(form_password, str)
-        assert isinstance(admin_password, str)
-        assert len(form_password) > 0
-        assert len(admin_password) > 0
+        for password in (get_form_password(), get_admin_password()):
+            assert isinstance(password, str)
+            assert len(password) > 0
 
 class TestSecurityFunctions:
     """Test security utility functions."""
     
-    def test_sanitize_input(self):
-        """Test input sanitization function."""
-        # Test HTML removal
-        dirty_input = '<script>alert("xss")</script>Hello'
-        clean_input = sanitize_input(dirty_input)
+    def test_sanitize_input_strips_tags(self):
+        """Test HTML removal in input sanitization."""
+        clean_input = sanitize_input('<script>alert("xss")</script>Hello')
         assert '<script>' not in clean_input
         assert 'Hello' in clean_input
-        
-        # Test normal text
-        normal_input = 'Normal text input'
-        clean_input = sanitize_input(normal_input)
-        assert clean_input == normal_input
-        
-        # Test empty input
-        empty_input = ''
-        clean_input = sanitize_input(empty_input)
-        assert clean_input == ''
-    
-    def test_validation_functions(self):
-        """Test validation utility functions."""
-        # Test word validation
-        assert is_valid_word('HELLO')
-        assert is_valid_word('hello')
-        assert is_valid_word('Hello World')
-        assert not is_valid_word('Hello123')
-        assert not is_valid_word('Hello!')
-        
-        # Test clue validation
-        assert is_valid_clue('This is a long enough clue')
-        assert not is_valid_clue('Short')
+    
+    @pytest.mark.parametrize("text", ['Normal text input', ''])
+    def test_sanitize_input_passthrough(self, text):
+        """Test that plain and empty input is left unchanged."""
+        assert sanitize_input(text) == text
+    
+    @pytest.mark.parametrize("text,expected", [
+        ('a < b > c', 'a &lt; b &gt; c'),  # not tags: escaped, not stripped
+        ('<script', '&lt;script'),  # unclosed tag
+        ('<!-- commento -->Ciao', 'Ciao'),
+        ('Tom &amp; Jerry', 'Tom &amp; Jerry'),  # existing entities are not escaped twice
+        ('&lt;b&gt;', '&lt;b&gt;'),
+        ('a & b', 'a &amp; b'),
+    ])
+    def test_sanitize_input_matches_bleach(self, text, expected):
+        """Test edge cases against the output bleach.clean gave."""
+        assert sanitize_input(text) == expected
+    
+    @pytest.mark.parametrize("word,ok", [
+        ('HELLO', True),
+        ('hello', True),
+        ('Hello World', True),
+        ('Hello123', False),
+        ('Hello!', False),
+    ])
+    def test_is_valid_word(self, word, ok):
+        """Test word validation."""
+        assert is_valid_word(word) is ok
+    
+    @pytest.mark.parametrize("clue,ok", [
+        ('This is a long enough clue', True),
+        ('Short', False),
+    ])
+    def test_is_valid_clue(self, clue, ok):
+        """Test clue validation."""
+        assert is_valid_clue(clue) is ok
 
 class TestAccessControl:
     """Test access control and permissions."""
@@ -523,20 +697,20 @@ class TestAccessControl:
     def test_form_access_without_auth(self, client):
         """Test that form access requires authentication."""
         response = client.get('/')
-        page_content = response.get_data(as_text=True)
+        page_content = response.data
         
         # Should show password form, not submission form (unless rate limited)
         if response.status_code == 200:
-            assert 'Password' in page_content or 'access_password' in page_content
+            assert b'Password' in page_content or b'access_password' in page_content
         elif response.status_code == 429:
             # Rate limited - this is also acceptable
-            assert 'troppi tentativi' in page_content.lower() or 'too many' in page_content.lower()
+            assert b'troppi tentativi' in page_content.lower() or b'too many' in page_content.lower()
     
     def test_admin_functions_without_auth(self, client):
         """Test that admin functions require authentication."""
         # Admin dashboard
         response = client.get('/admin')
-        assert 'Password' in response.get_data(as_text=True)
+        assert b'Password' in response.data
         
         # CSV export
         response = client.get('/admin/export')
@@ -5,44 +5,175 @@ Integration Tests for Cruciverba Application
 These tests verify end-to-end functionality and real-world usage scenarios.
 """
 
+import asyncio
+import importlib.util
+import os
+import re
+import time
 import pytest
 import requests
-import time
-import threading
-from urllib.parse import urljoin
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+from urllib.parse import urlencode, urljoin
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # Configuration for integration tests
 BASE_URL = "http://localhost:8080"
 FORM_PASSWORD = "bianca"
 ADMIN_PASSWORD = "bianca2024"
+# (connect, read) timeout in seconds, so a hung server fails a test quickly
+REQUEST_TIMEOUT = (1, 5)
+# Simultaneous users in test_concurrent_users; each one logs in and submits,
+# so keep it within the form's rate limit (30 requests per minute per IP)
+CONCURRENT_USERS = 5
+# Seconds to keep polling for a server that is still starting up (0: probe once)
+SERVER_WAIT = float(os.environ.get('INTEGRATION_SERVER_WAIT', 0))
 
-class TestLiveApplication:
-    """Integration tests against running application."""
+# Form login body, encoded once and reused by every login POST
+_LOGIN_BODY = urlencode({'access_password': FORM_PASSWORD})
+_FORM_HEADERS = {'Content-Type': 'application/x-www-form-urlencoded'}
+
+# Malicious form inputs, one test per payload
+XSS_PAYLOADS = (
+    '<script>alert("xss")</script>',
+    '<img src=x onerror=alert("xss")>',
+    'javascript:alert("xss")',
+    '<svg onload=alert("xss")>',
+    '"><script>alert("xss")</script>'
+)
+SQL_PAYLOADS = (
+    "'; DROP TABLE submissions; --",
+    "' OR '1'='1",
+    "' UNION SELECT * FROM submissions --",
+    "'; INSERT INTO submissions VALUES (1,'hack','hack','hack'); --"
+)
+
+# Injected markup that would run: a payload's script, event handler or
+# javascript: link (the pages' own inline <script> blocks do not match)
+_FORBIDDEN = re.compile(r'<script>\s*alert|<[^>]*\bon(?:error|load)\s*=|\b(?:href|src)\s*=\s*["\']?javascript:', re.I)
+# Database errors leaking into a page (the echoed form may well say "SQL")
+_SQL_ERR = re.compile(r'syntax error|sqlite|OperationalError|IntegrityError', re.I)
+
+def _wait_for_server(wait=SERVER_WAIT):
+    """Poll the server until it answers or `wait` seconds have passed.
     
-    @pytest.fixture(autouse=True)
-    def check_server(self):
-        """Check if the server is running before tests."""
+    Returns the first response, or None if the server never accepted a
+    connection. Returns as soon as the server is up instead of sleeping
+    for a fixed interval.
+    """
+    deadline = time.monotonic() + wait
+    while True:
         try:
-            response = requests.get(BASE_URL, timeout=5)
-            if response.status_code != 200:
-                pytest.skip("Application server not running on localhost:8080")
+            return requests.get(BASE_URL, timeout=REQUEST_TIMEOUT)
         except requests.ConnectionError:
-            pytest.skip("Application server not running on localhost:8080")
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            time.sleep(min(0.2, remaining))
+
+@pytest.fixture(scope="session")
+def check_server():
+    """Check once per session that the server is running.
+    
+    pytest caches the skip raised here, so every later live test is skipped
+    without probing the server again.
+    """
+    response = _wait_for_server()
+    if response is None or response.status_code != 200:
+        pytest.skip("Application server not running on localhost:8080")
+
+class _TimeoutSession(requests.Session):
+    """Session that applies REQUEST_TIMEOUT unless a request sets its own."""
+    
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', REQUEST_TIMEOUT)
+        return super().request(method, url, **kwargs)
+
+def _pooled_session():
+    """Create a session whose connection pool also serves the concurrent tests."""
+    session = _TimeoutSession()
+    # No retries: a failed request should fail the test, not be hidden by a retry
+    adapter = HTTPAdapter(pool_connections=32, pool_maxsize=64,
+                          max_retries=Retry(total=0, connect=0, read=0))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+class _PageLandmarks(HTMLParser):
+    """Form field names and visible text of an HTML page."""
+    
+    def __init__(self):
+        super().__init__()
+        self.fields = set()
+        self._text = []
+        self._skip = 0
+    
+    def handle_starttag(self, tag, attrs):
+        if tag in ('input', 'textarea', 'select'):
+            name = dict(attrs).get('name')
+            if name:
+                self.fields.add(name)
+        elif tag in ('script', 'style'):
+            self._skip += 1
+    
+    def handle_endtag(self, tag):
+        if tag in ('script', 'style'):
+            self._skip -= 1
+    
+    def handle_data(self, data):
+        if not self._skip:
+            self._text.append(data)
+    
+    @property
+    def text(self):
+        return ' '.join(' '.join(self._text).split())
+
+def _parse(response):
+    """Parse a page once; the result is cached on the response."""
+    page = getattr(response, '_landmarks', None)
+    if page is None:
+        page = _PageLandmarks()
+        page.feed(response.text)
+        page.close()
+        response._landmarks = page
+    return page
+
+@pytest.fixture(scope="session")
+def form_cookies(check_server):
+    """Log in to the form once and keep the resulting session cookies."""
+    with _pooled_session() as session:
+        response = session.post(BASE_URL, data=_LOGIN_BODY, headers=_FORM_HEADERS)
+        assert response.status_code == 200
+        yield requests.utils.dict_from_cookiejar(session.cookies)
+        # Release the server-side session once every test is done with it
+        session.get(f"{BASE_URL}/logout", allow_redirects=False)
+
+@pytest.fixture
+def authed_session(form_cookies):
+    """Fresh session carrying the form login cookies, without logging in again."""
+    session = _pooled_session()
+    session.cookies = requests.utils.cookiejar_from_dict(form_cookies)
+    yield session
+    session.close()
+
+@pytest.mark.usefixtures("check_server")
+class TestLiveApplication:
+    """Integration tests against running application."""
     
     def test_complete_user_journey(self):
         """Test complete user journey from login to submission."""
-        session = requests.Session()
+        session = _pooled_session()
         
         # Step 1: Access main page (should show login)
         response = session.get(BASE_URL)
         assert response.status_code == 200
-        assert "Password di accesso" in response.text
+        assert 'access_password' in _parse(response).fields
         
         # Step 2: Login with correct password
-        response = session.post(BASE_URL, data={
-            'access_password': FORM_PASSWORD
-        })
+        response = session.post(BASE_URL, data=_LOGIN_BODY, headers=_FORM_HEADERS)
         assert response.status_code == 200
+        assert 'parola' in _parse(response).fields
         
         # Step 3: Submit a valid contribution
         test_data = {
@@ -53,13 +184,14 @@ class TestLiveApplication:
         
         response = session.post(BASE_URL, data=test_data)
         assert response.status_code == 200
-        assert "Grazie Integration Test User!" in response.text
-        assert "Aggiungi un'altra parola" in response.text
+        page = _parse(response)
+        assert "Grazie Integration Test User!" in page.text
+        assert "Aggiungi un'altra parola" in page.text
         
         # Step 4: Add another word
         response = session.get(BASE_URL)
         assert response.status_code == 200
-        assert "Parola" in response.text  # Form should be accessible
+        assert 'parola' in _parse(response).fields  # Form should be accessible
         
         # Step 5: Submit another contribution
         test_data2 = {
@@ -70,20 +202,20 @@ class TestLiveApplication:
         
         response = session.post(BASE_URL, data=test_data2)
         assert response.status_code == 200
-        assert "Grazie Integration Test User!" in response.text
+        assert "Grazie Integration Test User!" in _parse(response).text
         
         # Step 6: Logout
-        response = session.get(f"{BASE_URL}/form_logout")
+        response = session.get(f"{BASE_URL}/logout", allow_redirects=False)
         assert response.status_code == 302
     
     def test_admin_workflow(self):
         """Test complete admin workflow."""
-        session = requests.Session()
+        session = _pooled_session()
         
         # Step 1: Access admin page
         response = session.get(f"{BASE_URL}/admin")
         assert response.status_code == 200
-        assert "Password" in response.text
+        assert 'password' in _parse(response).fields
         
         # Step 2: Login as admin
         response = session.post(f"{BASE_URL}/admin", data={
@@ -94,21 +226,22 @@ class TestLiveApplication:
         # Step 3: View dashboard
         response = session.get(f"{BASE_URL}/admin")
         assert response.status_code == 200
-        assert "Pannello Amministratore" in response.text
+        assert "Pannello Amministratore" in _parse(response).text
         
-        # Step 4: Export CSV
-        response = session.get(f"{BASE_URL}/admin/export")
-        assert response.status_code == 200
-        assert response.headers.get('Content-Type') == 'text/csv; charset=utf-8'
-        assert 'Parola,Frase Indizio,Nome,Data' in response.text
+        # Step 4: Export CSV (streamed; only the first 64 bytes are read)
+        with session.get(f"{BASE_URL}/admin/export", stream=True) as response:
+            assert response.status_code == 200
+            assert response.headers.get('Content-Type') == 'text/csv; charset=utf-8'
+            header = response.raw.read(64, decode_content=True)
+            assert header.startswith(b'Parola,Frase Indizio,Nome,Data')
         
         # Step 5: Logout
-        response = session.get(f"{BASE_URL}/admin/logout")
+        response = session.get(f"{BASE_URL}/admin/logout", allow_redirects=False)
         assert response.status_code == 302
     
     def test_security_headers_live(self):
         """Test security headers on live application."""
-        response = requests.get(BASE_URL)
+        response = requests.get(BASE_URL, timeout=REQUEST_TIMEOUT)
         
         # Check security headers
         assert response.headers.get('X-Content-Type-Options') == 'nosniff'
@@ -118,150 +251,125 @@ class TestLiveApplication:
         assert 'default-src \'self\'' in response.headers.get('Content-Security-Policy', '')
         assert response.headers.get('Referrer-Policy') == 'strict-origin-when-cross-origin'
     
-    def test_rate_limiting_simulation(self):
-        """Test rate limiting with multiple requests."""
-        session = requests.Session()
+    def test_rate_limiting_simulation(self, authed_session):
+        """Test rate limiting with a burst of simultaneous requests."""
+        def submit(data):
+            return authed_session.post(BASE_URL, data=data).status_code
         
-        # Login first
-        login_response = session.post(BASE_URL, data={
-            'access_password': FORM_PASSWORD
-        })
-        assert login_response.status_code == 200
-        
-        # Make multiple rapid requests
-        responses = []
-        for i in range(15):  # Exceed the 10 per minute limit
-            response = session.post(BASE_URL, data={
-                'parola': f'TEST{i}',
-                'frase_indizio': f'Test frase indizio numero {i} con almeno dieci caratteri',
-                'nome': f'Test User {i}'
-            })
-            responses.append(response.status_code)
-            time.sleep(0.1)  # Small delay
+        payloads = ({
+            'parola': f'TEST{i}',
+            'frase_indizio': f'Test frase indizio numero {i} con almeno dieci caratteri',
+            'nome': f'Test User {i}'
+        } for i in range(15))
         
-        # Should eventually get rate limited (429 status code)
-        # Note: This might not trigger in testing environment
-        assert any(status in [429, 200] for status in responses)
+        # Fire all requests at once, with no client-side pacing: the limiter
+        # (30 per minute per IP on the form) decides which ones get through
+        with ThreadPoolExecutor(max_workers=15) as executor:
+            # 15 requests stay under the limit so later tests are not locked out;
+            # they are rate limited (429) only if earlier tests used up the budget
+            assert any(status in (429, 200) for status in executor.map(submit, payloads))
     
     def test_concurrent_users(self):
         """Test concurrent user submissions."""
         def user_submission(user_id):
             """Simulate a user submission."""
-            session = requests.Session()
-            
-            # Login
-            session.post(BASE_URL, data={'access_password': FORM_PASSWORD})
-            
-            # Submit
-            response = session.post(BASE_URL, data={
-                'parola': f'CONCURRENT{user_id}',
-                'frase_indizio': f'Frase indizio per test concorrente numero {user_id}',
-                'nome': f'Concurrent User {user_id}'
-            })
+            with _pooled_session() as session:
+                # Login
+                session.post(BASE_URL, data=_LOGIN_BODY, headers=_FORM_HEADERS)
+                
+                # Submit
+                response = session.post(BASE_URL, data={
+                    'parola': f'CONCURRENT{user_id}',
+                    'frase_indizio': f'Frase indizio per test concorrente numero {user_id}',
+                    'nome': f'Concurrent User {user_id}'
+                })
             return response.status_code == 200
         
-        # Create multiple threads for concurrent users
-        threads = []
-        results = []
-        
-        for i in range(5):
-            thread = threading.Thread(
-                target=lambda uid=i: results.append(user_submission(uid))
-            )
-            threads.append(thread)
-            thread.start()
-        
-        # Wait for all threads to complete
-        for thread in threads:
-            thread.join()
+        # One pooled worker per user; results come back in user order
+        with ThreadPoolExecutor(max_workers=CONCURRENT_USERS) as executor:
+            results = list(executor.map(user_submission, range(CONCURRENT_USERS)))
         
         # All submissions should be successful
         assert all(results), f"Some concurrent submissions failed: {results}"
     
-    def test_malicious_input_protection(self):
-        """Test protection against malicious inputs."""
-        session = requests.Session()
+    def test_concurrent_users_async(self):
+        """Test concurrent submissions multiplexed over a single HTTP/2 client."""
+        httpx = pytest.importorskip("httpx")
+        pytest.importorskip("h2")
         
-        # Login
-        session.post(BASE_URL, data={'access_password': FORM_PASSWORD})
+        async def submit_all():
+            # Servers without HTTP/2 (gunicorn) get HTTP/1.1 on the same pool
+            async with httpx.AsyncClient(http2=True, base_url=BASE_URL,
+                                         timeout=httpx.Timeout(5, connect=1)) as client:
+                await client.post("/", content=_LOGIN_BODY, headers=_FORM_HEADERS)
+                responses = await asyncio.gather(*(
+                    client.post("/", data={
+                        'parola': f'ASYNC{user_id}',
+                        'frase_indizio': f'Frase indizio per test asincrono numero {user_id}',
+                        'nome': f'Async User {user_id}'
+                    })
+                    for user_id in range(CONCURRENT_USERS)
+                ))
+            return [response.status_code for response in responses]
         
-        # Test XSS attempts
-        xss_payloads = [
-            '<script>alert("xss")</script>',
-            '<img src=x onerror=alert("xss")>',
-            'javascript:alert("xss")',
-            '<svg onload=alert("xss")>',
-            '"><script>alert("xss")</script>'
-        ]
+        statuses = asyncio.run(submit_all())
+        assert statuses == [200] * CONCURRENT_USERS, f"Some async submissions failed: {statuses}"
+    
+    @pytest.mark.parametrize("payload", XSS_PAYLOADS)
+    def test_malicious_input_protection(self, authed_session, payload):
+        """Test protection against malicious inputs."""
+        response = authed_session.post(BASE_URL, data={
+            'parola': 'SICUREZZA',
+            'frase_indizio': f'Test payload: {payload}',
+            'nome': f'XSS Test {payload[:10]}'
+        })
         
-        for payload in xss_payloads:
-            response = session.post(BASE_URL, data={
-                'parola': 'SICUREZZA',
-                'frase_indizio': f'Test payload: {payload}',
-                'nome': f'XSS Test {payload[:10]}'
-            })
-            
-            # Should not contain the payload in response
-            assert '<script>' not in response.text
-            assert 'onerror=' not in response.text
-            assert 'javascript:' not in response.text
+        # Should not contain the payload as live markup
+        match = _FORBIDDEN.search(response.text)
+        assert match is None, match.group()
     
-    def test_sql_injection_protection(self):
+    @pytest.mark.parametrize("payload", SQL_PAYLOADS)
+    def test_sql_injection_protection(self, authed_session, payload):
         """Test protection against SQL injection."""
-        session = requests.Session()
-        
-        # Login
-        session.post(BASE_URL, data={'access_password': FORM_PASSWORD})
-        
-        # Test SQL injection payloads
-        sql_payloads = [
-            "'; DROP TABLE submissions; --",
-            "' OR '1'='1",
-            "' UNION SELECT * FROM submissions --",
-            "'; INSERT INTO submissions VALUES (1,'hack','hack','hack'); --"
-        ]
+        response = authed_session.post(BASE_URL, data={
+            'parola': 'SICUREZZA',
+            'frase_indizio': f'SQL injection test with payload',
+            'nome': payload
+        })
         
-        for payload in sql_payloads:
-            response = session.post(BASE_URL, data={
-                'parola': 'SICUREZZA',
-                'frase_indizio': f'SQL injection test with payload',
-                'nome': payload
-            })
-            
-            # Application should handle it gracefully
-            assert response.status_code in [200, 400]
-            # Should not contain SQL error messages
-            assert 'syntax error' not in response.text.lower()
-            assert 'sql' not in response.text.lower()
+        # Application should handle it gracefully
+        assert response.status_code in [200, 400]
+        # Should not contain SQL error messages
+        match = _SQL_ERR.search(response.text)
+        assert match is None, match.group()
+
+@pytest.fixture(scope="session")
+def cruciverba_container():
+    """Find the application container once per session, or skip its tests."""
+    try:
+        import docker
+    except ImportError:
+        pytest.skip("Docker client not available")
+    try:
+        containers = docker.from_env().containers.list(filters={'name': 'cruciverba-bianca'})
+    except Exception as e:
+        pytest.skip(f"Docker test failed: {e}")
+    if not containers:
+        pytest.skip("Docker container not found")
+    return containers[0]
 
 class TestDockerDeployment:
     """Tests specific to Docker deployment."""
     
-    def test_docker_container_health(self):
+    def test_docker_container_health(self, cruciverba_container):
         """Test Docker container health."""
-        try:
-            import docker
-            client = docker.from_env()
-            
-            # Find our container
-            containers = client.containers.list(filters={'name': 'cruciverba-bianca'})
-            if not containers:
-                pytest.skip("Docker container not found")
-            
-            container = containers[0]
-            
-            # Check container status
-            assert container.status == 'running'
-            
-            # Check health if health check is configured
-            if hasattr(container.attrs['State'], 'Health'):
-                health = container.attrs['State']['Health']['Status']
-                assert health in ['healthy', 'starting']
-                
-        except ImportError:
-            pytest.skip("Docker client not available")
-        except Exception as e:
-            pytest.skip(f"Docker test failed: {e}")
+        # Check container status
+        assert cruciverba_container.status == 'running'
+        
+        # Check health if health check is configured
+        state = cruciverba_container.attrs['State']
+        if 'Health' in state:
+            assert state['Health']['Status'] in ['healthy', 'starting']
     
     def test_volume_persistence(self):
         """Test that data persists across container restarts."""
@@ -278,21 +386,19 @@ def run_integration_tests():
     print()
     
     # Check if server is running
-    try:
-        response = requests.get(BASE_URL, timeout=5)
-        print(f"✅ Server is running (HTTP {response.status_code})")
-    except requests.ConnectionError:
+    response = _wait_for_server()
+    if response is None:
         print("❌ Server is not running. Please start the application first:")
         print("   docker-compose up -d")
         return False
+    print(f"✅ Server is running (HTTP {response.status_code})")
     
-    # Run pytest on this file
-    import subprocess
-    result = subprocess.run([
-        'python', '-m', 'pytest', __file__, '-v'
-    ], capture_output=False)
-    
-    return result.returncode == 0
+    # Run pytest on this file in this interpreter, spread over all CPUs
+    # when pytest-xdist is installed
+    args = [__file__, '-v']
+    if importlib.util.find_spec('xdist'):
+        args += ['-n', 'auto']
+    return pytest.main(args) == 0
 
 if __name__ == '__main__':
     success = run_integration_tests()